@@ -0,0 +1,52 @@
+"""add product.effective_price and the category browsing indexes
+
+Tables are created by Base.metadata.create_all on startup, which never alters an
+existing table. This revision brings a product table created before the
+effective_price column up to date. On a database where create_all already built
+the column and indexes it does nothing.
+
+Adding a stored generated column rewrites the product table under an ACCESS
+EXCLUSIVE lock, so run it in a maintenance window on large catalogues.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # nothing to alter yet, create_all will build the table with the column on startup
+    if not sa.inspect(op.get_bind()).has_table("product"):
+        return
+
+    op.execute(
+        "ALTER TABLE product ADD COLUMN IF NOT EXISTS effective_price DOUBLE PRECISION "
+        "GENERATED ALWAYS AS (COALESCE(discount_price, price)) STORED"
+    )
+    op.execute("CREATE INDEX IF NOT EXISTS ix_product_effective_price ON product (effective_price)")
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_category_effective_price "
+        "ON product (lower(category_name), effective_price)"
+    )
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_product_category_created_at "
+        "ON product (lower(category_name), created_at)"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_product_category_created_at")
+    op.execute("DROP INDEX IF EXISTS ix_product_category_effective_price")
+    op.execute("DROP INDEX IF EXISTS ix_product_effective_price")
+    op.execute("ALTER TABLE product DROP COLUMN IF EXISTS effective_price")
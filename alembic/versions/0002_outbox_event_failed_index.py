@@ -0,0 +1,31 @@
+"""add the partial index for dead outbox events
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    if not sa.inspect(op.get_bind()).has_table("outbox_event"):
+        return
+
+    op.execute(
+        "CREATE INDEX IF NOT EXISTS ix_outbox_event_failed_at "
+        "ON outbox_event (failed_at) WHERE failed_at IS NOT NULL"
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_outbox_event_failed_at")
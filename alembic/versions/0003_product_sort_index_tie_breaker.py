@@ -0,0 +1,55 @@
+"""add product_id to the product sort indexes
+
+The product listing orders by (effective_price, product_id) or (created_at,
+product_id). Revision 0001 indexed the sort columns without the product_id
+tie-breaker, so every page still went through an Incremental Sort. This revision
+rebuilds those indexes with product_id as their last column. Indexes that already
+have it (built by create_all) are left alone.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 00:00:00
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "ix_product_effective_price": "effective_price",
+    "ix_product_category_effective_price": "lower(category_name), effective_price",
+    "ix_product_category_created_at": "lower(category_name), created_at",
+}
+
+
+def _rebuild(with_tie_breaker: bool) -> None:
+    bind = op.get_bind()
+    if not sa.inspect(bind).has_table("product"):
+        return
+
+    for name, columns in INDEXES.items():
+        definition = bind.execute(
+            sa.text("SELECT indexdef FROM pg_indexes WHERE indexname = :name"), {"name": name}
+        ).scalar()
+        if definition is not None and definition.rstrip().endswith("product_id)") == with_tie_breaker:
+            continue
+
+        if with_tie_breaker:
+            columns += ", product_id"
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+        op.execute(f"CREATE INDEX {name} ON product ({columns})")
+
+
+def upgrade() -> None:
+    _rebuild(with_tie_breaker=True)
+
+
+def downgrade() -> None:
+    _rebuild(with_tie_breaker=False)
@@ -1,9 +1,23 @@
-from sqlalchemy.orm import Session, selectinload
+import logging
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from datetime import datetime, timedelta, timezone
+from sqlalchemy.orm import Session, load_only, selectinload
 from typing import List, Optional
 from . import models, schemas
+from .outbox import ORDER_CREATED
 from auth import utils as auth_util
 from .models import UserRole
 
+logger = logging.getLogger(__name__)
+
+# How long a stored Idempotency-Key response can be replayed
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
+# Rows per INSERT statement (and per commit) in create_users_bulk
+BULK_INSERT_BATCH_SIZE = 1000
+
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     db_user = db.query(models.User).filter(models.User.user_id == user_id).first()    
     return db_user
@@ -34,7 +48,6 @@ def create_user(db: Session, user: schemas.UserCreate) -> models.User:
 
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
@@ -53,10 +66,91 @@ def create_user_with_role(db: Session, user: schemas.AdminUserCreate, role: User
 
     db.add(db_user)
     db.commit()
-    db.refresh(db_user)
     return db_user
 
 
+# Restricts an entity query to the requested columns. The primary key is always
+# loaded by SQLAlchemy, relationships are left unloaded unless asked for.
+def _apply_fields(query, model, fields: Optional[List[str]]):
+    if not fields:
+        return query
+
+    columns = [getattr(model, field) for field in fields if field in model.__table__.columns]
+    if not columns:
+        # only relationships were requested, the primary key is enough to load them
+        columns = [getattr(model, column.key) for column in model.__mapper__.primary_key]
+    return query.options(load_only(*columns))
+
+
+def get_existing_emails(db: Session, emails: List[str]) -> set:
+    rows = db.query(models.User.email).filter(models.User.email.in_(emails)).all()
+    return {email for (email,) in rows}
+
+
+def create_users_bulk(db: Session, users: List[schemas.AdminUserCreate]) -> List[schemas.BulkUserResult]:
+    results = [None] * len(users)
+
+    # one query for every email in the request, duplicates within the request are caught here too
+    existing = get_existing_emails(db, [user.email for user in users])
+    pending = []
+    for index, user in enumerate(users):
+        if user.email in existing:
+            results[index] = schemas.BulkUserResult(
+                index=index, email=user.email, status=schemas.BulkUserStatus.duplicate, detail="Email already registered"
+            )
+            continue
+        existing.add(user.email)
+        pending.append((index, user))
+
+    hashed_passwords = auth_util.hash_passwords([user.password[:72] for _, user in pending])
+
+    for start in range(0, len(pending), BULK_INSERT_BATCH_SIZE):
+        batch = pending[start:start + BULK_INSERT_BATCH_SIZE]
+        rows = [
+            {
+                "email": user.email,
+                "password_hash": hashed_password,
+                "first_name": user.first_name,
+                "last_name": user.last_name,
+                "phone_number": user.phone_number,
+                "role": user.role,
+            }
+            for (_, user), hashed_password in zip(batch, hashed_passwords[start:start + BULK_INSERT_BATCH_SIZE])
+        ]
+
+        # emails registered concurrently since the check above are skipped instead of failing the batch
+        statement = (
+            pg_insert(models.User)
+            .on_conflict_do_nothing(index_elements=[models.User.email])
+            .returning(models.User.user_id, models.User.email)
+        )
+        try:
+            created = {email: user_id for user_id, email in db.execute(statement, rows)}
+            db.commit()
+        except Exception as exc:
+            # each batch commits on its own, a failed one is reported and the rest still run
+            db.rollback()
+            logger.exception("Bulk user insert failed for rows %d-%d", batch[0][0], batch[-1][0])
+            for index, user in batch:
+                results[index] = schemas.BulkUserResult(
+                    index=index, email=user.email, status=schemas.BulkUserStatus.failed,
+                    detail=f"Batch insert failed: {exc.__class__.__name__}"
+                )
+            continue
+
+        for index, user in batch:
+            if user.email in created:
+                results[index] = schemas.BulkUserResult(
+                    index=index, email=user.email, status=schemas.BulkUserStatus.created, user_id=created[user.email]
+                )
+            else:
+                results[index] = schemas.BulkUserResult(
+                    index=index, email=user.email, status=schemas.BulkUserStatus.duplicate, detail="Email already registered"
+                )
+
+    return results
+
+
 def get_product(db: Session, product_id: int) -> Optional[models.Product]:
     db_product = db.query(models.Product).filter(models.Product.product_id == product_id).first()
     return db_product
@@ -69,7 +163,6 @@ def create_product(db: Session, product: schemas.ProductCreate) -> models.Produc
 
     db.add(db_product)
     db.commit()
-    db.refresh(db_product)
     return db_product
 
 
@@ -77,17 +170,42 @@ def get_filtered_products(
     db: Session,
     category: Optional[str] = None,
     subcategory: Optional[str] = None,
+    exact_category: bool = False,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: Optional[schemas.ProductSort] = None,
+    only_active: bool = False,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    fields: Optional[List[str]] = None
 ) -> List[models.Product]:
-    query = db.query(models.Product)
+    query = _apply_fields(db.query(models.Product), models.Product, fields)
 
     if category:
-        query = query.filter(models.Product.category_name.ilike(f"%{category}%"))
+        if exact_category:
+            # equality on lower(category_name) can use the composite category indexes
+            query = query.filter(func.lower(models.Product.category_name) == category.lower())
+        else:
+            query = query.filter(models.Product.category_name.ilike(f"%{category}%"))
 
     if subcategory:
         query = query.filter(models.Product.subcategory_name.ilike(f"%{subcategory}%"))
 
+    if min_price is not None:
+        query = query.filter(models.Product.effective_price >= min_price)
+
+    if max_price is not None:
+        query = query.filter(models.Product.effective_price <= max_price)
+
+    if only_active:
+        query = query.filter(models.Product.is_active.is_(True))
+
+    # product_id is the tie-breaker so pagination stays stable between pages
+    if sort == schemas.ProductSort.price:
+        query = query.order_by(models.Product.effective_price, models.Product.product_id)
+    elif sort == schemas.ProductSort.newest:
+        query = query.order_by(models.Product.created_at.desc(), models.Product.product_id.desc())
+
     db_products = query.offset(skip).limit(limit).all()
     return db_products
 
@@ -105,7 +223,6 @@ def update_product(db: Session, product_id: int, product_update: schemas.Product
 
     db.add(db_product)
     db.commit()
-    db.refresh(db_product)
     return db_product
 
 # New function to delete a product (only by admin)
@@ -128,10 +245,11 @@ def get_addresses_by_user(
     db: Session,
     user_id: int,
     skip: int = 0,
-    limit: int = 100
+    limit: int = 100,
+    fields: Optional[List[str]] = None
 ) -> List[models.Address]:
     db_addresses = (
-        db.query(models.Address)
+        _apply_fields(db.query(models.Address), models.Address, fields)
         .filter(models.Address.user_id == user_id)
         .offset(skip)
         .limit(limit)
@@ -150,11 +268,17 @@ def create_address(db: Session, address: schemas.AddressCreateByUser, user_id: i
 
     db.add(db_address)
     db.commit()
-    db.refresh(db_address)
     return db_address
 
 
-def create_order(db: Session, order: schemas.OrderCreateByUser, user_id: int) -> Optional[models.Order]:
+def create_order(
+    db: Session,
+    order: schemas.OrderCreateByUser,
+    user_id: int,
+    idempotency_key: Optional[str] = None,
+    request_fingerprint: Optional[str] = None,
+    expired_key: Optional[models.IdempotencyKey] = None
+) -> Optional[models.Order]:
     db_user = db.query(models.User).filter(models.User.user_id == user_id).first()
     if not db_user:
         return {"error": f"User ID {user_id} not found."}
@@ -186,7 +310,7 @@ def create_order(db: Session, order: schemas.OrderCreateByUser, user_id: int) ->
         if item.quantity <= 0:
             return {"error": f"Quantity for Product ID {item.product_id} must be positive."}
 
-        item_price = db_product.discount_price if db_product.discount_price is not None else db_product.price
+        item_price = db_product.effective_price
 
         line_total = item_price * item.quantity
         total_amount += line_total
@@ -209,8 +333,40 @@ def create_order(db: Session, order: schemas.OrderCreateByUser, user_id: int) ->
     db_order.details.extend(db_details)
 
     db.add(db_order)
+    # flush to get the order_id for the event, both rows are committed in the same transaction
+    db.flush()
+
+    db.add(models.OutboxEvent(
+        event_type=ORDER_CREATED,
+        payload={
+            "order_id": db_order.order_id,
+            "user_id": db_order.user_id,
+            "total_amount": db_order.total_amount,
+        },
+    ))
+
+    # The response is stored with the order, so a retry either sees both or neither
+    if idempotency_key:
+        if expired_key is not None:
+            # The purger may not have deleted it yet. Only the exact row found expired is
+            # deleted, a key replaced concurrently stays and makes the insert fail.
+            db.query(models.IdempotencyKey).filter(
+                models.IdempotencyKey.user_id == expired_key.user_id,
+                models.IdempotencyKey.key == expired_key.key,
+                models.IdempotencyKey.expires_at == expired_key.expires_at
+            ).delete(synchronize_session=False)
+            db.expunge(expired_key)
+
+        db.add(models.IdempotencyKey(
+            user_id=user_id,
+            key=idempotency_key,
+            request_fingerprint=request_fingerprint,
+            response_status=201,
+            response_body=schemas.Order.model_validate(db_order).model_dump(mode="json"),
+            expires_at=datetime.now(timezone.utc) + IDEMPOTENCY_KEY_TTL,
+        ))
+
     db.commit()
-    db.refresh(db_order)
 
     return db_order
 
@@ -220,12 +376,46 @@ def get_order(db: Session, order_id: int) -> Optional[models.Order]:
     return db_order
 
 
-def get_user_orders(db: Session, user_id: int, skip: int = 0, limit: int = 100) -> List[models.Order]:
+def get_user_orders(
+    db: Session,
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[List[str]] = None
+) -> List[models.Order]:
+    query = _apply_fields(db.query(models.Order), models.Order, fields)
+
+    # details are only fetched when they are part of the response, in one extra query for the whole page
+    if not fields or "details" in fields:
+        query = query.options(selectinload(models.Order.details))
+
     db_orders = (
-        db.query(models.Order)
+        query
         .filter(models.Order.user_id == user_id)
         .offset(skip)
         .limit(limit)
         .all()
     )
-    return db_orders
\ No newline at end of file
+    return db_orders
+
+
+def get_idempotency_key(db: Session, user_id: int, key: str) -> Optional[models.IdempotencyKey]:
+    db_key = (
+        db.query(models.IdempotencyKey)
+        .filter(
+            models.IdempotencyKey.user_id == user_id,
+            models.IdempotencyKey.key == key
+        )
+        .first()
+    )
+    return db_key
+
+
+def purge_expired_idempotency_keys(db: Session) -> int:
+    deleted = (
+        db.query(models.IdempotencyKey)
+        .filter(models.IdempotencyKey.expires_at <= func.now())
+        .delete(synchronize_session=False)
+    )
+    db.commit()
+    return deleted
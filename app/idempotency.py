@@ -0,0 +1,93 @@
+"""
+Idempotency-Key support for POST /orders/.
+
+The first request with a key stores its response next to the order it created
+(see crud.create_order). Retries with the same key and the same body get that
+response replayed without touching products or addresses. A retry that reuses the
+key with a different body is rejected. Expired keys are deleted by
+IdempotencyKeyPurger in the background. Until then they are still found by the
+lookup but never replayed, a request reusing one replaces it with its own response.
+"""
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Callable
+
+from fastapi import HTTPException, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.orm import Session
+
+from . import crud, models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+PURGE_INTERVAL_SECONDS = 15 * 60
+
+
+def fingerprint(request: BaseModel) -> str:
+    return hashlib.sha256(request.model_dump_json().encode()).hexdigest()
+
+
+def is_expired(stored: models.IdempotencyKey) -> bool:
+    expires_at = stored.expires_at
+    if expires_at.tzinfo is None:
+        # SQLite drops the offset, the stored value is UTC
+        expires_at = expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= datetime.now(timezone.utc)
+
+
+def replay(stored: models.IdempotencyKey, request_fingerprint: str) -> JSONResponse:
+    if stored.request_fingerprint != request_fingerprint:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Idempotency-Key was already used with a different request"
+        )
+
+    return JSONResponse(
+        status_code=stored.response_status,
+        content=stored.response_body,
+        headers={"Idempotent-Replayed": "true"},
+    )
+
+
+class IdempotencyKeyPurger:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        interval: float = PURGE_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="idempotency-key-purger", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.purge()
+
+    def purge(self) -> int:
+        db = self.session_factory()
+        try:
+            return crud.purge_expired_idempotency_keys(db)
+        except Exception:
+            db.rollback()
+            logger.exception("Purging expired idempotency keys failed")
+            return 0
+        finally:
+            db.close()
@@ -4,28 +4,88 @@ This file is responsible for handling HTTP requests. It has decorators to define
 It calls the functions from the CRUD layer.
 
 """
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
 from typing import List, Optional
 
 from fastapi import Body
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from . import crud, models, schemas
+from . import crud, idempotency, models, outbox, schemas
 from .database import get_db
 from auth import utils as auth_util
+from auth.rate_limit import client_ip, login_limiter
+from auth.revocation import revocation_list
 
 from .database import engine
 models.Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+dispatcher = outbox.OutboxDispatcher()
+idempotency_purger = idempotency.IdempotencyKeyPurger()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers live as long as the application
+    revocation_list.start()
+    dispatcher.start()
+    idempotency_purger.start()
+    yield
+    idempotency_purger.stop()
+    dispatcher.stop()
+    revocation_list.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+# Sparse fieldsets: "?fields=name,price" is validated against the response schema
+# and the list endpoints then return only those keys.
+def parse_fields(fields: Optional[str], schema) -> Optional[List[str]]:
+    if not fields:
+        return None
+
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in schema.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field(s): {', '.join(unknown)}"
+        )
+
+    return requested or None
+
+
+def sparse_response(items, fields: List[str], nested: Optional[dict] = None) -> JSONResponse:
+    # nested maps relationship fields to the schema their objects are serialized with
+    nested = nested or {}
+    rows = []
+    for item in items:
+        row = {}
+        for field in fields:
+            value = getattr(item, field)
+            if field in nested:
+                value = [nested[field].model_validate(v) for v in value]
+            row[field] = value
+        rows.append(row)
+
+    return JSONResponse(content=jsonable_encoder(rows))
 
 
 @app.post("/token", tags=["Authentication"])
 def login_for_access_token(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
+    # Throttled before the user lookup and password hashing
+    login_limiter.check(email=form_data.username, client_ip=client_ip(request))
+
     user = crud.get_user_by_email(db, email=form_data.username)
 
     login_password = form_data.password[:72]
@@ -37,9 +97,86 @@ def login_for_access_token(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token = auth_util.create_access_token(data={"user_id": user.user_id})
+    return issue_tokens(user.user_id)
 
-    return {"access_token": access_token, "token_type": "bearer"}
+
+def issue_tokens(user_id: int) -> dict:
+    access_token = auth_util.create_access_token(data={"user_id": user_id})
+    refresh_token = auth_util.create_refresh_token(data={"user_id": user_id})
+
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+
+def revoked_token_values(payload: dict) -> dict:
+    return {
+        "jti": payload["jti"],
+        "user_id": payload["user_id"],
+        "token_type": payload["sub"],
+        "expires_at": datetime.fromtimestamp(payload["exp"], timezone.utc),
+    }
+
+
+def revoke_token(db: Session, payload: dict) -> None:
+    revocation_list.revoke(db, **revoked_token_values(payload))
+
+
+# Rotates a refresh token: the presented one is revoked and a new pair is issued, no password hashing involved.
+@app.post("/token/refresh", tags=["Authentication"])
+def refresh_access_token(body: schemas.TokenRefresh, db: Session = Depends(get_db)):
+    payload = auth_util.decode_token(db, body.refresh_token, "refresh")
+
+    if payload.get("jti") is None or crud.get_user(db, user_id=payload["user_id"]) is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    try:
+        revoke_token(db, payload)
+    except IntegrityError:
+        # another request rotated the same refresh token first
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+    return issue_tokens(payload["user_id"])
+
+
+# Logs out: revokes the bearer access token and, if given, the refresh token issued with it.
+# Idempotent, tokens that are already revoked (a repeated logout, a refresh token rotated since) are skipped.
+@app.post("/token/revoke", status_code=status.HTTP_204_NO_CONTENT, tags=["Authentication"])
+def revoke_tokens(
+    body: Optional[schemas.TokenRevoke] = Body(None),
+    token: str = Depends(auth_util.oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    access_payload = auth_util.decode_token(db, token, "access", check_revoked=False)
+    payloads = [access_payload]
+
+    refresh_error = None
+    if body is not None and body.refresh_token:
+        try:
+            refresh_payload = auth_util.decode_token(db, body.refresh_token, "refresh", check_revoked=False)
+        except HTTPException as exc:
+            refresh_error = exc
+        else:
+            if refresh_payload["user_id"] != access_payload["user_id"]:
+                refresh_error = HTTPException(
+                    status_code=status.HTTP_403_FORBIDDEN, detail="Refresh token belongs to another user"
+                )
+            else:
+                payloads.append(refresh_payload)
+
+    # both in one transaction, so a racing logout cannot leave only one of them revoked
+    revocation_list.revoke_many(db, [revoked_token_values(payload) for payload in payloads if payload.get("jti") is not None])
+
+    # the access token is revoked either way, an unusable refresh token is still reported
+    if refresh_error is not None:
+        raise refresh_error
 
 
 @app.post("/users/", response_model=schemas.User, tags=["Users"], status_code=status.HTTP_201_CREATED)
@@ -96,6 +233,25 @@ def create_user_by_admin(
 
 
 
+# Creates up to 100 users in one request, the response has one result per submitted row.
+# Callers importing more accounts split them over several requests.
+@app.post("/admin/users/bulk", response_model=List[schemas.BulkUserResult], tags=["Admin"])
+def create_users_bulk_by_admin(
+    body: schemas.AdminUserBulkCreate,
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth_util.get_current_admin_user)
+):
+    return crud.create_users_bulk(db, users=body.users)
+
+
+@app.get("/admin/outbox/metrics", response_model=schemas.OutboxMetrics, tags=["Admin"])
+def read_outbox_metrics(
+    db: Session = Depends(get_db),
+    current_admin: models.User = Depends(auth_util.get_current_admin_user)
+):
+    return dispatcher.metrics(db)
+
+
 @app.post("/products/", response_model=schemas.Product, tags=["Products"], status_code=status.HTTP_201_CREATED)
 def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db), current_admin_user: models.User = Depends(auth_util.get_current_admin_user)):
     return crud.create_product(db=db, product=product)
@@ -105,17 +261,35 @@ def create_product(product: schemas.ProductCreate, db: Session = Depends(get_db)
 def read_products(
     category: Optional[str] = None,
     subcategory: Optional[str] = None,
+    exact_category: bool = False,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    sort: Optional[schemas.ProductSort] = None,
+    only_active: bool = False,
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="min_price cannot be greater than max_price")
+
+    selected_fields = parse_fields(fields, schemas.Product)
     products = crud.get_filtered_products(
         db,
         category=category,
         subcategory=subcategory,
+        exact_category=exact_category,
+        min_price=min_price,
+        max_price=max_price,
+        sort=sort,
+        only_active=only_active,
         skip=skip,
-        limit=limit
+        limit=limit,
+        fields=selected_fields
     )
+    if selected_fields:
+        return sparse_response(products, selected_fields)
     return products
 
 # For updating product details (only by admin)
@@ -167,9 +341,13 @@ def read_user_addresses(
     user_id: int,
     skip: int = 0,
     limit: int = 100,
+    fields: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    addresses = crud.get_addresses_by_user(db, user_id=user_id, skip=skip, limit=limit)
+    selected_fields = parse_fields(fields, schemas.Address)
+    addresses = crud.get_addresses_by_user(db, user_id=user_id, skip=skip, limit=limit, fields=selected_fields)
+    if selected_fields:
+        return sparse_response(addresses, selected_fields)
     return addresses
 
 
@@ -200,23 +378,62 @@ def read_order(order_id: int, db: Session = Depends(get_db), current_user: model
 
 
 @app.get("/users/{user_id}/orders/", response_model=List[schemas.Order], tags=["Orders"])
-def read_user_orders(user_id: int, skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    orders = crud.get_user_orders(db, user_id=user_id, skip=skip, limit=limit)
+def read_user_orders(
+    user_id: int,
+    skip: int = 0,
+    limit: int = 100,
+    fields: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    selected_fields = parse_fields(fields, schemas.Order)
+    orders = crud.get_user_orders(db, user_id=user_id, skip=skip, limit=limit, fields=selected_fields)
+    if selected_fields:
+        return sparse_response(orders, selected_fields, nested={"details": schemas.OrderDetail})
     return orders
 
 
 @app.post("/orders/", response_model=schemas.Order, tags=["Orders"], status_code=status.HTTP_201_CREATED)
 def place_order(
     order: schemas.OrderCreateByUser,
+    idempotency_key: Optional[str] = Header(None, max_length=255),
     db: Session = Depends(get_db),
     current_user: models.User = Depends(auth_util.get_current_user)
 ):
     """
     Only accessible to authenticated users.
+
+    Clients can send an Idempotency-Key header, retries with the same key get the original response back.
     """
+    request_fingerprint = None
+    expired_key = None
+    if idempotency_key:
+        # Checked before any product or address lookups so retries stay cheap
+        request_fingerprint = idempotency.fingerprint(order)
+        stored = crud.get_idempotency_key(db, user_id=current_user.user_id, key=idempotency_key)
+        if stored:
+            if not idempotency.is_expired(stored):
+                return idempotency.replay(stored, request_fingerprint)
+            expired_key = stored
+
     # Ensuring order.user_id matches current_user.user_id here
     # for security, but the main point is the dependency check.
-    result = crud.create_order(db=db, order=order, user_id=current_user.user_id)
+    try:
+        result = crud.create_order(
+            db=db,
+            order=order,
+            user_id=current_user.user_id,
+            idempotency_key=idempotency_key,
+            request_fingerprint=request_fingerprint,
+            expired_key=expired_key
+        )
+    except IntegrityError:
+        # A concurrent request with the same key committed first, replay its response
+        db.rollback()
+        stored = crud.get_idempotency_key(db, user_id=current_user.user_id, key=idempotency_key) if idempotency_key else None
+        if stored is None or idempotency.is_expired(stored):
+            raise
+        return idempotency.replay(stored, request_fingerprint)
+
     if isinstance(result, dict) and 'error' in result:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=result['error'])
 
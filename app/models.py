@@ -6,9 +6,12 @@ from sqlalchemy import (
     Enum as SQLAlchemyEnum,
     Float,
     Boolean,
-    ForeignKey
+    ForeignKey,
+    Computed,
+    Index,
+    JSON
 )
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, null
 from sqlalchemy.orm import relationship
 import enum
 
@@ -22,6 +25,8 @@ class UserRole(enum.Enum):
 
 class User(Base):
     __tablename__ = "users"
+    # server defaults (created_at, updated_at, generated columns) come back via RETURNING
+    __mapper_args__ = {"eager_defaults": True}
 
     user_id = Column(Integer, primary_key=True, index=True)
     email = Column(String, unique=True, index=True, nullable=False)
@@ -33,11 +38,12 @@ class User(Base):
     # Stores user role and given default as user if we dont specify a role.
     role = Column(SQLAlchemyEnum(UserRole), nullable=False, default=UserRole.user)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=null(), onupdate=func.now())
 
 
 class Product(Base):
     __tablename__ = "product"
+    __mapper_args__ = {"eager_defaults": True}
 
     product_id = Column(Integer, primary_key=True, index=True)      # Primary Key
     category_name = Column(String, index=True, nullable=False)
@@ -48,14 +54,26 @@ class Product(Base):
     brand = Column(String, nullable=True)
     price = Column(Float, nullable=False)
     discount_price = Column(Float, nullable=True)
+    # Price the customer actually pays, generated by the database so it can be indexed.
+    effective_price = Column(Float, Computed("COALESCE(discount_price, price)", persisted=True))
     is_active = Column(Boolean, default=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=null(), onupdate=func.now())
+
+    # Indexes for browsing by price or by newest first, optionally within a category.
+    # product_id is the listing's tie-breaker, so the index order matches ORDER BY fully
+    # and a page is read straight from the index without sorting.
+    __table_args__ = (
+        Index("ix_product_effective_price", effective_price, product_id),
+        Index("ix_product_category_effective_price", func.lower(category_name), effective_price, product_id),
+        Index("ix_product_category_created_at", func.lower(category_name), created_at, product_id),
+    )
 
 
 class Address(Base):
     __tablename__ = "address"
+    __mapper_args__ = {"eager_defaults": True}
 
     address_id = Column(Integer, primary_key=True, index=True)      # Primary Key
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False, index=True)      # Foreign Key
@@ -70,7 +88,7 @@ class Address(Base):
     is_default_shipping = Column(Boolean, default=False)
     is_default_billing = Column(Boolean, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    updated_at = Column(DateTime(timezone=True), default=null(), onupdate=func.now())
 
     user = relationship("User", backref="addresses")
 
@@ -85,6 +103,7 @@ class OrderStatus(enum.Enum):
 
 class Order(Base):
     __tablename__ = "order"
+    __mapper_args__ = {"eager_defaults": True}
 
     order_id = Column(Integer, primary_key=True, index=True)        # Primary Key
     user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False, index=True)      # Foreign Key
@@ -103,6 +122,7 @@ class Order(Base):
 
 class OrderDetail(Base):
     __tablename__ = "order_detail"
+    __mapper_args__ = {"eager_defaults": True}
 
     order_detail_id = Column(Integer, primary_key=True, index=True)     # Primary Key
     order_id = Column(Integer, ForeignKey('order.order_id'), nullable=False, index=True)        # Foreign Key
@@ -114,4 +134,63 @@ class OrderDetail(Base):
     order = relationship("Order", back_populates="details")
     product = relationship("Product")
 
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_event"
+    __mapper_args__ = {"eager_defaults": True}
+
+    event_id = Column(Integer, primary_key=True, index=True)        # Primary Key
+    event_type = Column(String, nullable=False)
+    payload = Column(JSON, nullable=False)
+
+    # delivery state, maintained by the dispatcher in app/outbox.py
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(String, nullable=True)
+    available_at = Column(DateTime(timezone=True), server_default=func.now())
+    dispatched_at = Column(DateTime(timezone=True), nullable=True)
+    failed_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Only undelivered events are indexed, so the dispatcher's claim query stays small
+    # however many events have already been dispatched.
+    __table_args__ = (
+        Index(
+            "ix_outbox_event_pending",
+            available_at,
+            event_id,
+            postgresql_where=(dispatched_at.is_(None) & failed_at.is_(None)),
+        ),
+        # dead events are rare, this keeps the metrics count from scanning the whole table
+        Index("ix_outbox_event_failed_at", failed_at, postgresql_where=failed_at.isnot(None)),
+    )
+
+
+class IdempotencyKey(Base):
+    __tablename__ = "idempotency_key"
+    __mapper_args__ = {"eager_defaults": True}
+
+    # Keys are scoped per user, the composite primary key doubles as the lookup index
+    user_id = Column(Integer, ForeignKey('users.user_id'), primary_key=True)
+    key = Column(String, primary_key=True)
+    request_fingerprint = Column(String, nullable=False)
+    response_status = Column(Integer, nullable=False)
+    response_body = Column(JSON, nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_token"
+    __mapper_args__ = {"eager_defaults": True}
+
+    jti = Column(String, primary_key=True)      # Primary Key, the JWT "jti" claim
+    user_id = Column(Integer, ForeignKey('users.user_id'), nullable=False, index=True)      # Foreign Key
+    token_type = Column(String, nullable=False)
+
+    # rows past expires_at can be dropped, the token would be rejected anyway
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    revoked_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
@@ -0,0 +1,209 @@
+"""
+Transactional outbox for order events.
+
+crud.create_order writes an OutboxEvent row in the same transaction as the order.
+The OutboxDispatcher runs in a background thread. It claims pending events in batches
+with SELECT ... FOR UPDATE SKIP LOCKED (so several workers can run it side by side),
+leases them by moving available_at LEASE_SECONDS ahead and commits. The handlers
+registered for each event's type then run outside any transaction, and the outcome of
+the batch is written back with one UPDATE per outcome.
+
+Delivery is at-least-once: if any handler fails the event is retried with
+exponential backoff and every handler sees it again, so handlers must be idempotent.
+A batch whose handlers outlast the lease can be claimed by another dispatcher as well.
+"""
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import models
+from .database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+ORDER_CREATED = "order.created"
+
+BATCH_SIZE = 100
+POLL_INTERVAL_SECONDS = 1.0
+MAX_ATTEMPTS = 8
+BASE_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 300.0
+LEASE_SECONDS = 60.0
+
+_handlers: Dict[str, List[Callable[[dict], None]]] = defaultdict(list)
+
+
+def register_handler(event_type: str):
+    """Decorator registering a function that receives the payload of every event_type event."""
+    def decorator(handler: Callable[[dict], None]):
+        _handlers[event_type].append(handler)
+        return handler
+    return decorator
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(BASE_BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+
+
+def _pending(query):
+    return query.filter(
+        models.OutboxEvent.dispatched_at.is_(None),
+        models.OutboxEvent.failed_at.is_(None),
+    )
+
+
+def _by_ids(db: Session, event_ids: List[int]):
+    return db.query(models.OutboxEvent).filter(models.OutboxEvent.event_id.in_(event_ids))
+
+
+class OutboxDispatcher:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        batch_size: int = BATCH_SIZE,
+        poll_interval: float = POLL_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+
+        # in-process counters, reported by metrics()
+        self.dispatched_total = 0
+        self.retried_total = 0
+        self.failed_total = 0
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="outbox-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            claimed = self.dispatch_batch()
+            # a full batch means there is probably more waiting, so only sleep when caught up
+            if claimed < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def dispatch_batch(self) -> int:
+        db = self.session_factory()
+        try:
+            events = self._claim(db)
+
+            # handlers run outside any transaction, a slow one holds no locks
+            delivered = [(event, self._deliver(event)) for event in events]
+
+            self._record(db, delivered)
+            return len(events)
+        except Exception:
+            db.rollback()
+            logger.exception("Outbox dispatch batch failed")
+            return 0
+        finally:
+            db.close()
+
+    def _claim(self, db: Session) -> list:
+        now = datetime.now(timezone.utc)
+        events = (
+            _pending(db.query(
+                models.OutboxEvent.event_id,
+                models.OutboxEvent.event_type,
+                models.OutboxEvent.payload,
+                models.OutboxEvent.attempts,
+            ))
+            .filter(models.OutboxEvent.available_at <= now)
+            .order_by(models.OutboxEvent.available_at, models.OutboxEvent.event_id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+        # Leased events are invisible to other dispatchers until the lease runs out. If this
+        # worker dies before recording the outcome they are claimed again after that.
+        if events:
+            _by_ids(db, [event.event_id for event in events]).update(
+                {"available_at": now + timedelta(seconds=LEASE_SECONDS)}, synchronize_session=False
+            )
+        db.commit()
+        return events
+
+    def _deliver(self, event) -> Optional[Exception]:
+        try:
+            for handler in _handlers.get(event.event_type, []):
+                handler(event.payload)
+        except Exception as exc:
+            return exc
+        return None
+
+    def _record(self, db: Session, delivered: list) -> None:
+        now = datetime.now(timezone.utc)
+        dispatched = []
+        # events failing with the same error on the same attempt share one UPDATE
+        retries = defaultdict(list)
+        for event, error in delivered:
+            if error is None:
+                dispatched.append(event.event_id)
+            else:
+                retries[(event.attempts + 1, repr(error)[:500])].append(event.event_id)
+
+        if dispatched:
+            _by_ids(db, dispatched).update({"dispatched_at": now}, synchronize_session=False)
+
+        failed = retried = 0
+        for (attempts, last_error), event_ids in retries.items():
+            values = {"attempts": attempts, "last_error": last_error}
+            if attempts >= MAX_ATTEMPTS:
+                values["failed_at"] = now
+                failed += len(event_ids)
+                logger.error("Outbox events %s gave up after %s attempts", event_ids, attempts)
+            else:
+                values["available_at"] = now + timedelta(seconds=backoff_seconds(attempts))
+                retried += len(event_ids)
+            _by_ids(db, event_ids).update(values, synchronize_session=False)
+
+        db.commit()
+        self.dispatched_total += len(dispatched)
+        self.retried_total += retried
+        self.failed_total += failed
+
+    def metrics(self, db: Session) -> dict:
+        pending, oldest_pending_at = _pending(
+            db.query(func.count(models.OutboxEvent.event_id), func.min(models.OutboxEvent.created_at))
+        ).one()
+        dead = (
+            db.query(func.count(models.OutboxEvent.event_id))
+            .filter(models.OutboxEvent.failed_at.isnot(None))
+            .scalar()
+        )
+
+        lag_seconds = 0.0
+        if oldest_pending_at is not None:
+            if oldest_pending_at.tzinfo is None:
+                # SQLite drops the offset, the stored value is UTC
+                oldest_pending_at = oldest_pending_at.replace(tzinfo=timezone.utc)
+            lag_seconds = max((datetime.now(timezone.utc) - oldest_pending_at).total_seconds(), 0.0)
+
+        return {
+            "pending": pending,
+            "dead": dead,
+            "oldest_pending_at": oldest_pending_at,
+            "lag_seconds": lag_seconds,
+            "dispatched_total": self.dispatched_total,
+            "retried_total": self.retried_total,
+            "failed_total": self.failed_total,
+        }
@@ -2,10 +2,19 @@ from datetime import datetime
 from typing import Optional, List
 from enum import Enum as PyEnum
 
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, Field
 
 from .models import UserRole
 
+# ------------------ Token Schemas ------------------
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
+
+class TokenRevoke(BaseModel):
+    refresh_token: Optional[str] = None
+
+
 # ------------------ User Schemas ------------------
 class UserBase(BaseModel):
     email: EmailStr
@@ -34,6 +43,29 @@ class AdminUserCreate(UserBase):
     role: UserRole 
 
 
+# Each row costs an Argon2 hash (~200 ms of one core), 100 rows finish within a normal
+# request timeout even on a single core. Larger imports are sent as several requests.
+BULK_MAX_USERS = 100
+
+
+class AdminUserBulkCreate(BaseModel):
+    users: List[AdminUserCreate] = Field(..., min_length=1, max_length=BULK_MAX_USERS)
+
+
+class BulkUserStatus(str, PyEnum):
+    created = "created"
+    duplicate = "duplicate"
+    failed = "failed"  # the row's batch could not be inserted, nothing in it was created
+
+
+class BulkUserResult(BaseModel):
+    index: int  # position of the row in the request
+    email: EmailStr
+    status: BulkUserStatus
+    user_id: Optional[int] = None
+    detail: Optional[str] = None
+
+
 # ------------------ Product Schemas ------------------
 
 class ProductBase(BaseModel):
@@ -58,12 +90,17 @@ class ProductCreate(ProductBase):
 class Product(ProductBase):
 
     product_id: int
+    effective_price: Optional[float] = None
     created_at: datetime
     updated_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
 
+class ProductSort(str, PyEnum):
+    price = "price"
+    newest = "newest"
+
 # New class for updating product details (only by admin)
 class ProductUpdate(BaseModel):
     name: Optional[str] = None
@@ -175,4 +212,16 @@ class Order(BaseModel):
     details: List[OrderDetail]
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+# ------------------ Outbox Schemas ------------------
+
+class OutboxMetrics(BaseModel):
+    pending: int
+    dead: int
+    oldest_pending_at: Optional[datetime] = None
+    lag_seconds: float
+    dispatched_total: int
+    retried_total: int
+    failed_total: int
@@ -0,0 +1,118 @@
+"""
+Token-bucket throttling for the login endpoint.
+
+Every attempt takes a token from the bucket of the client IP and from the bucket
+of the email being tried. Empty buckets are answered with 429 before the user is
+looked up or any password is hashed, which keeps credential-stuffing bursts from
+tying up workers with Argon2.
+
+The default backend keeps buckets in process memory, capped at max_keys with the
+least recently used buckets evicted first. Deployments running several workers can
+share limits by passing a RateLimitBackend implementation (e.g. one backed by
+Redis) to LoginRateLimiter.set_backend().
+
+Behind a reverse proxy or load balancer every request arrives from the proxy's
+address, so all clients would share one IP bucket. Either run uvicorn with
+--proxy-headers --forwarded-allow-ips=<proxy address>, which makes request.client
+the real client, or set RATE_LIMIT_CLIENT_IP_HEADER to the header the proxy puts
+the client address in. Only set it when a proxy always overwrites that header,
+otherwise clients can choose their own bucket.
+"""
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import HTTPException, Request, status
+
+# Burst size and sustained rate (tokens per second) of each bucket
+EMAIL_CAPACITY = 5
+EMAIL_REFILL_PER_SECOND = 5 / 60
+IP_CAPACITY = 20
+IP_REFILL_PER_SECOND = 20 / 60
+
+MAX_KEYS = 100_000
+
+# e.g. "X-Real-IP" or "X-Forwarded-For", unset means the socket address is used
+CLIENT_IP_HEADER = os.environ.get("RATE_LIMIT_CLIENT_IP_HEADER")
+
+
+def client_ip(request: Request) -> str:
+    if CLIENT_IP_HEADER:
+        value = request.headers.get(CLIENT_IP_HEADER)
+        if value:
+            # X-Forwarded-For lists every hop, the last one was appended by our proxy
+            return value.split(",")[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RateLimitBackend(ABC):
+    @abstractmethod
+    def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        """Take one token from the bucket for key.
+
+        Returns 0 when a token was available, otherwise the number of seconds
+        until the next one will be.
+        """
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated_at")
+
+    def __init__(self, tokens: float, updated_at: float):
+        self.tokens = tokens
+        self.updated_at = updated_at
+
+
+class InMemoryBackend(RateLimitBackend):
+    def __init__(self, max_keys: int = MAX_KEYS):
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, _Bucket]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def consume(self, key: str, capacity: float, refill_per_second: float) -> float:
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = _Bucket(capacity, now)
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket.tokens = min(capacity, bucket.tokens + (now - bucket.updated_at) * refill_per_second)
+                bucket.updated_at = now
+
+            if bucket.tokens >= 1:
+                bucket.tokens -= 1
+                return 0.0
+            return (1 - bucket.tokens) / refill_per_second
+
+
+class LoginRateLimiter:
+    def __init__(self, backend: Optional[RateLimitBackend] = None):
+        self.backend = backend if backend is not None else InMemoryBackend()
+
+    def set_backend(self, backend: RateLimitBackend) -> None:
+        self.backend = backend
+
+    def check(self, email: str, client_ip: str) -> None:
+        # The IP bucket is checked first so a blocked client does not drain the victim's email bucket
+        retry_after = self.backend.consume(f"ip:{client_ip}", IP_CAPACITY, IP_REFILL_PER_SECOND)
+        if not retry_after:
+            retry_after = self.backend.consume(f"email:{email.strip().lower()}", EMAIL_CAPACITY, EMAIL_REFILL_PER_SECOND)
+
+        if retry_after:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many login attempts, try again later",
+                headers={"Retry-After": str(int(retry_after) + 1)},
+            )
+
+
+login_limiter = LoginRateLimiter()
@@ -0,0 +1,185 @@
+"""
+Token revocation backed by an in-memory Bloom filter.
+
+Revoked token ids (the JWT "jti" claim) are stored in the revoked_token table and
+added to a Bloom filter held by every worker. get_current_user only asks the
+database when the filter reports a possible hit, so the common case (token not
+revoked) is answered from memory.
+
+Each worker re-reads recent revocations every SYNC_INTERVAL_SECONDS, so a token
+revoked through another worker is rejected everywhere within that interval. The
+filter is rebuilt from scratch every REBUILD_INTERVAL_SECONDS to drop expired ids.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, List
+
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+CAPACITY = 1_000_000
+ERROR_RATE = 0.001
+SYNC_INTERVAL_SECONDS = 10
+REBUILD_INTERVAL_SECONDS = 60 * 60
+
+# Revocations committed around a sync can carry a revoked_at slightly older than the
+# previous sync time, so incremental syncs look back a little further.
+SYNC_OVERLAP = timedelta(seconds=30)
+
+
+class BloomFilter:
+    def __init__(self, capacity: int = CAPACITY, error_rate: float = ERROR_RATE):
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        # double hashing: k positions derived from the two halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+
+class RevocationList:
+    def __init__(
+        self,
+        session_factory: Callable[[], Session] = SessionLocal,
+        capacity: int = CAPACITY,
+        error_rate: float = ERROR_RATE,
+        sync_interval: float = SYNC_INTERVAL_SECONDS,
+        rebuild_interval: float = REBUILD_INTERVAL_SECONDS,
+    ):
+        self.session_factory = session_factory
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.sync_interval = sync_interval
+        self.rebuild_interval = rebuild_interval
+
+        self._filter = BloomFilter(capacity, error_rate)
+        # jtis revoked by this worker while a rebuild runs, they are missing from the new filter
+        self._revoked_during_rebuild = None
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self._rebuilt_at = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_revoked(self, db: Session, jti: str) -> bool:
+        if jti not in self._filter:
+            return False
+
+        # possible false positive, the table has the final word
+        return db.query(models.RevokedToken.jti).filter(models.RevokedToken.jti == jti).first() is not None
+
+    def revoke(self, db: Session, jti: str, user_id: int, token_type: str, expires_at: datetime) -> None:
+        """Commits the revocation, raises IntegrityError if jti was already revoked."""
+        db.add(models.RevokedToken(jti=jti, user_id=user_id, token_type=token_type, expires_at=expires_at))
+        db.commit()
+        self._add(jti)
+
+    def revoke_many(self, db: Session, tokens: List[dict]) -> None:
+        """Commits the revocations in one transaction, ids that are already revoked are skipped.
+
+        Each dict holds the RevokedToken columns jti, user_id, token_type and expires_at.
+        """
+        if not tokens:
+            return
+        db.execute(
+            pg_insert(models.RevokedToken).on_conflict_do_nothing(index_elements=[models.RevokedToken.jti]),
+            tokens,
+        )
+        db.commit()
+        for token in tokens:
+            self._add(token["jti"])
+
+    def _add(self, jti: str) -> None:
+        with self._lock:
+            self._filter.add(jti)
+            if self._revoked_during_rebuild is not None:
+                self._revoked_during_rebuild.append(jti)
+
+    def sync(self, full: bool = False) -> None:
+        db = self.session_factory()
+        try:
+            now = db.query(func.now()).scalar()
+            full = full or self._synced_at is None
+
+            if full:
+                with self._lock:
+                    self._revoked_during_rebuild = []
+                db.query(models.RevokedToken).filter(models.RevokedToken.expires_at <= now).delete(synchronize_session=False)
+                db.commit()
+
+            query = db.query(models.RevokedToken.jti).filter(models.RevokedToken.expires_at > now)
+            if not full:
+                query = query.filter(models.RevokedToken.revoked_at >= self._synced_at - SYNC_OVERLAP)
+
+            if full:
+                # a rebuild fills a fresh filter and swaps it in, so lookups never see a partial one
+                target = BloomFilter(self.capacity, self.error_rate)
+                for (jti,) in query.yield_per(10_000):
+                    target.add(jti)
+
+                with self._lock:
+                    # revoke() calls that committed after the query started only reached the old filter
+                    for jti in self._revoked_during_rebuild:
+                        target.add(jti)
+                    self._filter = target
+                self._rebuilt_at = time.monotonic()
+            else:
+                for (jti,) in query.yield_per(10_000):
+                    with self._lock:
+                        self._filter.add(jti)
+
+            self._synced_at = now
+        finally:
+            if full:
+                with self._lock:
+                    self._revoked_during_rebuild = None
+            db.close()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        try:
+            self.sync(full=True)
+        except Exception:
+            logger.exception("Initial revocation list sync failed")
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.sync_interval):
+            try:
+                self.sync(full=time.monotonic() - self._rebuilt_at >= self.rebuild_interval)
+            except Exception:
+                logger.exception("Revocation list sync failed")
+
+
+revocation_list = RevocationList()
@@ -1,3 +1,7 @@
+import os
+import uuid  # unique token ids ("jti") so single tokens can be revoked
+from concurrent.futures import ThreadPoolExecutor  # parallel hashing for bulk user creation
+from typing import List
 from datetime import datetime, timedelta, timezone  # used for the expiration time for JWT
 from jose import JWTError, jwt  # used for creating and decoding JWTs and for handling potential errors during decoding.
 from passlib.context import CryptContext  # for hashing and verifying passwords
@@ -8,6 +12,7 @@ from app.database import get_db
 from app import models
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
+from auth.revocation import revocation_list
 
 # Creating instance of cyrptcontext and also, depcrecated is used if any older hashing shcmes were used passlib would automatically upgrade them to bcrypt
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -21,6 +26,14 @@ ph = PasswordHasher()
 def hash_password(password: str) -> str:
     return ph.hash(password)
 
+# argon2-cffi releases the GIL while hashing, so threads run in parallel. Bulk hashing gets
+# at most half the cores, the rest stay free for verify_password on /token.
+BULK_HASH_WORKERS = max(1, (os.cpu_count() or 1) // 2)
+_hash_executor = ThreadPoolExecutor(max_workers=BULK_HASH_WORKERS, thread_name_prefix="password-hash")
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    return list(_hash_executor.map(hash_password, passwords))
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     try:
         return ph.verify(hashed_password, plain_password)
@@ -31,6 +44,8 @@ SECRET_KEY = "secret_key_h"
 ALGORITHM = "HS256"
 # 30 mins time set for expiration
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# refresh tokens are exchanged at /token/refresh for a new pair without re-entering the password
+REFRESH_TOKEN_EXPIRE_DAYS = 7
 
 # server will check whether the token is valid or not. lilke for example whoever bears ( or holds ) the token is granted access.
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -39,33 +54,55 @@ def create_access_token(data: dict):
     # creating copy so as not to modify original dict.
     to_encode = data.copy()
     expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire, "sub": "access"})
+    to_encode.update({"exp": expire, "sub": "access", "jti": uuid.uuid4().hex})
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     # returns newly created token string
     return encoded_jwt
 
-# model.user type hint indicating function is expected to run an instance of user model.
-def get_current_user(
-    db: Session = Depends(get_db),
-    # this tells oauth2_scheme to get the token from the requests authorization header and pass it as the token argument.
-    token: str = Depends(oauth2_scheme)
-) -> models.User:
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("user_id")
 
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
+def create_refresh_token(data: dict):
+    to_encode = data.copy()
+    expire = datetime.now(timezone.utc) + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    to_encode.update({"exp": expire, "sub": "refresh", "jti": uuid.uuid4().hex})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
 
+# Decodes a token and checks it is of the expected kind ("access" or "refresh") and, unless
+# check_revoked is False, that it has not been revoked.
+def decode_token(db: Session, token: str, token_type: str, check_revoked: bool = True) -> dict:
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
     except JWTError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials"
         )
 
+    if payload.get("sub") != token_type or payload.get("user_id") is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid token payload"
+        )
+
+    jti = payload.get("jti")
+    # tokens issued before revocation support have no jti and simply run until they expire
+    if check_revoked and jti is not None and revocation_list.is_revoked(db, jti):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked"
+        )
+
+    return payload
+
+# model.user type hint indicating function is expected to run an instance of user model.
+def get_current_user(
+    db: Session = Depends(get_db),
+    # this tells oauth2_scheme to get the token from the requests authorization header and pass it as the token argument.
+    token: str = Depends(oauth2_scheme)
+) -> models.User:
+    payload = decode_token(db, token, "access")
+    user_id: int = payload.get("user_id")
+
     user = db.query(models.User).filter(models.User.user_id == user_id).first()
 
     if user is None:
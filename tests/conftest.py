@@ -0,0 +1,80 @@
+import os
+import tempfile
+
+# The app creates its engine at import time, so the database has to be chosen first.
+# Tests use a throwaway SQLite file unless DATABASE_URL points at a scratch PostgreSQL.
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/test.db")
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import models
+from app.database import SessionLocal, engine
+from app.main import app
+from auth.rate_limit import InMemoryBackend, login_limiter
+
+
+@pytest.fixture(autouse=True)
+def reset_database():
+    models.Base.metadata.drop_all(bind=engine)
+    models.Base.metadata.create_all(bind=engine)
+    # every test logs in, a shared bucket would start answering 429
+    login_limiter.set_backend(InMemoryBackend())
+    yield
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def statements():
+    """Records the SQL of every statement sent to the database while the test runs."""
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield recorded
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.fixture
+def admin_headers(client, db):
+    client.post("/users/", json={
+        "email": "admin@example.com", "password": "secret", "first_name": "Ada", "last_name": "Admin"
+    })
+    admin = db.query(models.User).filter(models.User.email == "admin@example.com").first()
+    admin.role = models.UserRole.admin
+    db.commit()
+
+    token = client.post("/token", data={"username": "admin@example.com", "password": "secret"}).json()["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def product(client, admin_headers):
+    response = client.post("/products/", headers=admin_headers, json={
+        "name": "Runner", "description": "Running shoe", "price": 100.0, "discount_price": 80.0, "category_name": "Shoes"
+    })
+    return response.json()
+
+
+@pytest.fixture
+def address(client, admin_headers):
+    response = client.post("/addresses/", headers=admin_headers, json={
+        "address_line1": "1 Main Street", "city": "Delhi", "state": "Delhi", "postal_code": "110001"
+    })
+    return response.json()
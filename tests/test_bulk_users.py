@@ -0,0 +1,40 @@
+"""
+POST /admin/users/bulk.
+"""
+import pytest
+
+from app import crud, models, schemas
+from app.database import engine
+
+
+def user(i, first_name="Bulk"):
+    return {"email": f"bulk{i}@example.com", "password": "secret", "first_name": first_name, "last_name": str(i), "role": "user"}
+
+
+def test_bulk_create_reports_each_row(client, admin_headers):
+    response = client.post("/admin/users/bulk", headers=admin_headers, json={
+        "users": [user(0), user(1), user(0), {**user(2), "email": "admin@example.com"}]
+    })
+
+    assert response.status_code == 200
+    assert [row["status"] for row in response.json()] == ["created", "created", "duplicate", "duplicate"]
+
+
+@pytest.mark.skipif(engine.dialect.name != "postgresql", reason="relies on PostgreSQL rejecting NUL characters")
+def test_failed_batch_is_rolled_back_and_the_rest_created(client, admin_headers, db, monkeypatch):
+    monkeypatch.setattr(crud, "BULK_INSERT_BATCH_SIZE", 2)
+    # PostgreSQL rejects NUL characters in text, which fails the second batch
+    users = [user(0), user(1), user(2), user(3, first_name="Bad\x00"), user(4)]
+
+    response = client.post("/admin/users/bulk", headers=admin_headers, json={"users": users})
+
+    assert response.status_code == 200
+    assert [row["status"] for row in response.json()] == ["created", "created", "failed", "failed", "created"]
+    emails = {email for (email,) in db.query(models.User.email).filter(models.User.email.like("bulk%"))}
+    assert emails == {"bulk0@example.com", "bulk1@example.com", "bulk4@example.com"}
+
+
+def test_request_size_is_capped(client, admin_headers):
+    response = client.post("/admin/users/bulk", headers=admin_headers, json={"users": [user(i) for i in range(schemas.BULK_MAX_USERS + 1)]})
+
+    assert response.status_code == 422
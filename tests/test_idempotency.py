@@ -0,0 +1,69 @@
+"""
+Idempotency-Key handling of POST /orders/.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import idempotency, models
+
+
+def order_body(product, address, quantity=1):
+    return {
+        "shipping_address_id": address["address_id"],
+        "billing_address_id": address["address_id"],
+        "items": [{"product_id": product["product_id"], "quantity": quantity}],
+    }
+
+
+def test_retry_replays_the_original_response(client, admin_headers, product, address, db):
+    headers = {**admin_headers, "Idempotency-Key": "order-1"}
+    first = client.post("/orders/", headers=headers, json=order_body(product, address))
+    retry = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    assert first.status_code == 201
+    assert retry.status_code == 201
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert db.query(models.Order).count() == 1
+
+
+def test_key_reused_with_a_different_body_is_rejected(client, admin_headers, product, address):
+    headers = {**admin_headers, "Idempotency-Key": "order-1"}
+    client.post("/orders/", headers=headers, json=order_body(product, address))
+    response = client.post("/orders/", headers=headers, json=order_body(product, address, quantity=2))
+
+    assert response.status_code == 409
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_expired_key_not_yet_purged_creates_a_new_order(client, admin_headers, product, address, db):
+    headers = {**admin_headers, "Idempotency-Key": "order-1"}
+    first = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    db.query(models.IdempotencyKey).update({"expires_at": datetime.now(timezone.utc) - timedelta(minutes=5)})
+    db.commit()
+
+    second = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    assert second.status_code == 201
+    assert "Idempotent-Replayed" not in second.headers
+    assert second.json()["order_id"] != first.json()["order_id"]
+
+    # the key now belongs to the new order and replays it
+    retry = client.post("/orders/", headers=headers, json=order_body(product, address))
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json()["order_id"] == second.json()["order_id"]
+
+
+@pytest.mark.filterwarnings("error::sqlalchemy.exc.SAWarning")
+def test_expired_key_is_replaced_when_the_database_clock_disagrees(client, admin_headers, product, address, monkeypatch):
+    headers = {**admin_headers, "Idempotency-Key": "order-1"}
+    first = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    # the app clock runs ahead: the key looks expired here but not to the database
+    monkeypatch.setattr(idempotency, "is_expired", lambda stored: True)
+    second = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    assert second.status_code == 201
+    assert second.json()["order_id"] != first.json()["order_id"]
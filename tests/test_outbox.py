@@ -0,0 +1,127 @@
+"""
+OutboxDispatcher delivery, retries and GET /admin/outbox/metrics.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import models, outbox
+from app.database import SessionLocal
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    registered = defaultdict(list)
+    monkeypatch.setattr(outbox, "_handlers", registered)
+    return registered
+
+
+@pytest.fixture
+def dispatcher():
+    return outbox.OutboxDispatcher()
+
+
+def add_events(db, count=1, **values):
+    events = [models.OutboxEvent(event_type="test.event", payload={"n": i}, **values) for i in range(count)]
+    db.add_all(events)
+    db.commit()
+    return events
+
+
+def reload(event_id):
+    session = SessionLocal()
+    try:
+        return session.get(models.OutboxEvent, event_id)
+    finally:
+        session.close()
+
+
+def as_utc(value):
+    # SQLite drops the offset, the stored value is UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def test_events_are_delivered_once(db, handlers, dispatcher):
+    received = []
+    handlers["test.event"].append(received.append)
+    events = add_events(db, count=3)
+
+    assert dispatcher.dispatch_batch() == 3
+    assert dispatcher.dispatch_batch() == 0
+    assert sorted(payload["n"] for payload in received) == [0, 1, 2]
+    assert all(reload(event.event_id).dispatched_at is not None for event in events)
+    assert dispatcher.dispatched_total == 3
+
+
+def test_batch_outcome_is_written_with_set_based_updates(db, handlers, dispatcher, statements):
+    handlers["test.event"].append(lambda payload: None)
+    add_events(db, count=5)
+
+    dispatcher.dispatch_batch()
+
+    # one UPDATE leases the batch, one marks it dispatched
+    assert len([s for s in statements if s.lstrip().upper().startswith("UPDATE")]) == 2
+
+
+def test_handlers_run_after_the_claim_is_committed(db, handlers, dispatcher):
+    leased_until = []
+
+    def handler(payload):
+        # a separate session sees the lease, so no transaction is held open around the handler
+        leased_until.append(as_utc(reload(event.event_id).available_at))
+
+    handlers["test.event"].append(handler)
+    (event,) = add_events(db)
+
+    dispatcher.dispatch_batch()
+
+    assert leased_until[0] > datetime.now(timezone.utc) + timedelta(seconds=outbox.LEASE_SECONDS / 2)
+
+
+def test_failed_delivery_is_retried_with_backoff(db, handlers, dispatcher):
+    def failing(payload):
+        raise RuntimeError("smtp down")
+
+    handlers["test.event"].append(failing)
+    (event,) = add_events(db)
+
+    assert dispatcher.dispatch_batch() == 1
+    stored = reload(event.event_id)
+    assert stored.attempts == 1
+    assert "smtp down" in stored.last_error
+    assert stored.dispatched_at is None and stored.failed_at is None
+    assert as_utc(stored.available_at) > datetime.now(timezone.utc) + timedelta(seconds=outbox.backoff_seconds(1) / 2)
+
+    # not due again until the backoff has passed
+    assert dispatcher.dispatch_batch() == 0
+    assert dispatcher.retried_total == 1
+
+
+def test_event_is_parked_after_max_attempts(db, handlers, dispatcher):
+    def failing(payload):
+        raise RuntimeError("smtp down")
+
+    handlers["test.event"].append(failing)
+    (event,) = add_events(db, attempts=outbox.MAX_ATTEMPTS - 1)
+
+    dispatcher.dispatch_batch()
+
+    stored = reload(event.event_id)
+    assert stored.attempts == outbox.MAX_ATTEMPTS
+    assert stored.failed_at is not None
+    assert dispatcher.failed_total == 1
+
+
+def test_metrics_endpoint(client, admin_headers, db):
+    add_events(db, count=2)
+    add_events(db, attempts=outbox.MAX_ATTEMPTS, failed_at=datetime.now(timezone.utc))
+
+    response = client.get("/admin/outbox/metrics", headers=admin_headers)
+
+    assert response.status_code == 200
+    metrics = response.json()
+    assert metrics["pending"] == 2
+    assert metrics["dead"] == 1
+    assert metrics["oldest_pending_at"] is not None
+    assert metrics["lag_seconds"] >= 0
@@ -0,0 +1,50 @@
+import pytest
+
+
+@pytest.fixture
+def catalogue(client, admin_headers):
+    rows = [
+        ("Runner", "Shoes", 100.0, 80.0, True),
+        ("Walker", "Shoes", 50.0, None, True),
+        ("Retired", "Shoes", 20.0, 10.0, False),
+        ("Sandal", "Shoes and Sandals", 30.0, None, True),
+        ("Cap", "Hats", 15.0, None, True),
+    ]
+    for name, category, price, discount_price, is_active in rows:
+        client.post("/products/", headers=admin_headers, json={
+            "name": name, "description": "d", "price": price, "discount_price": discount_price,
+            "is_active": is_active, "category_name": category,
+        })
+
+
+def names(response):
+    return [product["name"] for product in response.json()]
+
+
+def test_category_matches_substrings_by_default(client, catalogue):
+    response = client.get("/products/?category=shoe&sort=price")
+
+    assert names(response) == ["Retired", "Sandal", "Walker", "Runner"]
+
+
+def test_exact_category_is_opt_in(client, catalogue):
+    response = client.get("/products/?category=SHOES&exact_category=true&sort=price")
+
+    assert names(response) == ["Retired", "Walker", "Runner"]
+
+
+def test_price_range_uses_the_discounted_price(client, catalogue):
+    response = client.get("/products/?min_price=40&max_price=90&sort=price")
+
+    assert names(response) == ["Walker", "Runner"]
+    assert [p["effective_price"] for p in response.json()] == [50.0, 80.0]
+
+
+def test_only_active(client, catalogue):
+    response = client.get("/products/?category=Shoes&exact_category=true&only_active=true&sort=price")
+
+    assert names(response) == ["Walker", "Runner"]
+
+
+def test_inverted_price_range_is_rejected(client):
+    assert client.get("/products/?min_price=10&max_price=1").status_code == 400
@@ -0,0 +1,39 @@
+"""
+Runs the query-plan cases of scripts/check_query_plans.py as tests.
+
+Needs a scratch PostgreSQL database in QUERY_PLAN_DATABASE_URL, which is seeded with
+production-sized data on first use. Skipped when the variable is not set.
+"""
+import os
+
+import pytest
+from sqlalchemy import create_engine
+
+from scripts import check_query_plans
+
+QUERY_PLAN_DATABASE_URL = os.environ.get("QUERY_PLAN_DATABASE_URL")
+
+pytestmark = pytest.mark.skipif(not QUERY_PLAN_DATABASE_URL, reason="QUERY_PLAN_DATABASE_URL is not set")
+
+
+@pytest.fixture(autouse=True)
+def reset_database():
+    # overrides the conftest fixture, the seeded data must survive between cases
+    yield
+
+
+@pytest.fixture(scope="module")
+def plan_engine():
+    engine = create_engine(QUERY_PLAN_DATABASE_URL)
+    check_query_plans.seed(engine, scale=1.0, reseed=False)
+    yield engine
+    engine.dispose()
+
+
+@pytest.mark.parametrize("case", check_query_plans.CASES, ids=lambda case: case["name"])
+def test_query_plan(plan_engine, case):
+    plans = check_query_plans.capture_plans(plan_engine, case)
+
+    problems = check_query_plans.check(case, plans)
+    summary = [line for entry in plans for line in check_query_plans.summarize(entry["plan"])]
+    assert not problems, "\n".join(problems + summary)
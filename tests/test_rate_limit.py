@@ -0,0 +1,42 @@
+"""
+Login throttling and how the client address is chosen.
+"""
+import pytest
+
+from auth import rate_limit
+
+
+def login(client, email="nobody@example.com", headers=None):
+    return client.post("/token", data={"username": email, "password": "wrong"}, headers=headers or {})
+
+
+def test_backend_must_implement_consume():
+    with pytest.raises(TypeError):
+        rate_limit.RateLimitBackend()
+
+
+def test_email_bucket_throttles_login(client):
+    responses = [login(client) for _ in range(rate_limit.EMAIL_CAPACITY + 1)]
+
+    assert [r.status_code for r in responses[:-1]] == [401] * rate_limit.EMAIL_CAPACITY
+    assert responses[-1].status_code == 429
+    assert int(responses[-1].headers["Retry-After"]) > 0
+
+
+def test_forwarded_header_ignored_by_default(client):
+    for i in range(rate_limit.IP_CAPACITY):
+        login(client, email=f"user{i}@example.com", headers={"X-Real-IP": f"10.0.0.{i}"})
+
+    assert login(client, email="other@example.com", headers={"X-Real-IP": "10.0.1.1"}).status_code == 429
+
+
+def test_client_ip_header_gives_each_client_its_own_bucket(client, monkeypatch):
+    monkeypatch.setattr(rate_limit, "CLIENT_IP_HEADER", "X-Forwarded-For")
+    for i in range(rate_limit.IP_CAPACITY):
+        login(client, email=f"user{i}@example.com", headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.1"})
+
+    blocked = login(client, email="other@example.com", headers={"X-Forwarded-For": "203.0.113.8, 10.0.0.1"})
+    assert blocked.status_code == 429
+    # the last hop is the address our proxy saw, anything before it is client supplied
+    other = login(client, email="other@example.com", headers={"X-Forwarded-For": "203.0.113.7, 10.0.0.2"})
+    assert other.status_code == 401
@@ -0,0 +1,121 @@
+"""
+Logout and the revocation list kept by each worker.
+"""
+from datetime import datetime, timedelta, timezone
+
+from jose import jwt
+
+from app import models
+from app.database import SessionLocal
+from auth import revocation
+from auth.utils import ALGORITHM, SECRET_KEY
+
+
+def login(client):
+    client.post("/users/", json={
+        "email": "user@example.com", "password": "secret", "first_name": "Sam", "last_name": "User"
+    })
+    return client.post("/token", data={"username": "user@example.com", "password": "secret"}).json()
+
+
+def test_logout_revokes_both_tokens(client):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    assert client.post("/token/revoke", headers=headers, json={"refresh_token": tokens["refresh_token"]}).status_code == 204
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+
+def test_concurrent_logout_with_the_same_refresh_token(client, db):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    refresh = jwt.decode(tokens["refresh_token"], SECRET_KEY, algorithms=[ALGORITHM])
+    # another worker committed the revocation, this worker's filter has not synced it yet
+    db.add(models.RevokedToken(
+        jti=refresh["jti"],
+        user_id=refresh["user_id"],
+        token_type="refresh",
+        expires_at=datetime.fromtimestamp(refresh["exp"], timezone.utc),
+    ))
+    db.commit()
+
+    response = client.post("/token/revoke", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 204
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_logout_with_a_rotated_refresh_token_revokes_the_access_token(client):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.post("/token/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 200
+
+    response = client.post("/token/revoke", headers=headers, json={"refresh_token": tokens["refresh_token"]})
+
+    assert response.status_code == 204
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_logout_is_idempotent_and_needs_no_body(client):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+    assert client.post("/token/revoke", headers=headers).status_code == 204
+    assert client.post("/token/revoke", headers=headers).status_code == 204
+    assert client.get("/users/me", headers=headers).status_code == 401
+
+
+def test_logout_with_another_users_refresh_token_still_revokes_the_access_token(client):
+    tokens = login(client)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    client.post("/users/", json={
+        "email": "other@example.com", "password": "secret", "first_name": "Other", "last_name": "User"
+    })
+    other = client.post("/token", data={"username": "other@example.com", "password": "secret"}).json()
+
+    response = client.post("/token/revoke", headers=headers, json={"refresh_token": other["refresh_token"]})
+
+    assert response.status_code == 403
+    assert client.get("/users/me", headers=headers).status_code == 401
+    assert client.post("/token/refresh", json={"refresh_token": other["refresh_token"]}).status_code == 200
+
+
+class CommittedSession:
+    """Stands in for the request's session, revoke() only adds and commits."""
+
+    def add(self, instance):
+        pass
+
+    def commit(self):
+        pass
+
+
+def test_revocation_during_rebuild_survives_the_swap(db, monkeypatch):
+    user = models.User(email="user@example.com", password_hash="x", first_name="Sam", last_name="User")
+    db.add(user)
+    db.flush()
+    db.add(models.RevokedToken(
+        jti="already-revoked", user_id=user.user_id, token_type="refresh",
+        expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+    ))
+    db.commit()
+
+    revocations = revocation.RevocationList(session_factory=SessionLocal, capacity=1000)
+    revocations.sync(full=True)
+
+    class RevokeWhileFilling(revocation.BloomFilter):
+        # a request on another thread revokes a token after the rebuild query has run
+        def add(self, item):
+            super().add(item)
+            if item == "already-revoked":
+                revocations.revoke(
+                    CommittedSession(), jti="revoked-mid-rebuild", user_id=user.user_id, token_type="access",
+                    expires_at=datetime.now(timezone.utc) + timedelta(days=1),
+                )
+
+    monkeypatch.setattr(revocation, "BloomFilter", RevokeWhileFilling)
+    revocations.sync(full=True)
+
+    assert "already-revoked" in revocations._filter
+    assert "revoked-mid-rebuild" in revocations._filter
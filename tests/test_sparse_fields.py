@@ -0,0 +1,55 @@
+def place_order(client, headers, product, address):
+    return client.post("/orders/", headers=headers, json={
+        "shipping_address_id": address["address_id"],
+        "billing_address_id": address["address_id"],
+        "items": [{"product_id": product["product_id"], "quantity": 1}],
+    })
+
+
+def selects_from(statements, table):
+    return [s for s in statements if s.lstrip().upper().startswith("SELECT") and f"FROM {table}" in s]
+
+
+def test_products_return_only_requested_fields(client, product, statements):
+    response = client.get("/products/?fields=name,price")
+
+    assert response.status_code == 200
+    assert response.json() == [{"name": "Runner", "price": 100.0}]
+    (query,) = selects_from(statements, "product")
+    assert "description" not in query
+
+
+def test_unknown_field_is_rejected(client):
+    response = client.get("/products/?fields=name,secret")
+
+    assert response.status_code == 400
+    assert "secret" in response.json()["detail"]
+
+
+def test_orders_with_only_details_load_only_the_primary_key(client, admin_headers, product, address, statements):
+    place_order(client, admin_headers, product, address)
+    statements.clear()
+
+    response = client.get("/users/1/orders/?fields=details")
+
+    assert response.status_code == 200
+    assert [len(order["details"]) for order in response.json()] == [1]
+    (query,) = selects_from(statements, '"order"')
+    assert "total_amount" not in query
+    assert "order_id" in query
+
+
+def test_orders_without_details_skip_the_relationship(client, admin_headers, product, address, statements):
+    place_order(client, admin_headers, product, address)
+    statements.clear()
+
+    response = client.get("/users/1/orders/?fields=order_id,status")
+
+    assert response.json() == [{"order_id": 1, "status": "pending"}]
+    assert selects_from(statements, "order_detail") == []
+
+
+def test_addresses_return_only_requested_fields(client, address):
+    response = client.get("/users/1/addresses/?fields=city")
+
+    assert response.json() == [{"city": "Delhi"}]
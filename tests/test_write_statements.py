@@ -0,0 +1,105 @@
+"""
+Statement budget of the write endpoints.
+
+Server defaults (ids, created_at, updated_at, effective_price) come back through
+INSERT/UPDATE ... RETURNING, so each endpoint issues a fixed number of writes and
+never reads the row back afterwards.
+"""
+from app.database import engine
+
+WRITE_PREFIXES = ("INSERT", "UPDATE", "DELETE")
+
+
+def writes(statements):
+    return [s for s in statements if s.lstrip().upper().startswith(WRITE_PREFIXES)]
+
+
+def assert_no_select_after_first_write(statements):
+    first_write = next(i for i, s in enumerate(statements) if s.lstrip().upper().startswith(WRITE_PREFIXES))
+    trailing_selects = [s for s in statements[first_write:] if s.lstrip().upper().startswith("SELECT")]
+    assert trailing_selects == []
+
+
+def test_create_user_is_one_insert(client, statements):
+    response = client.post("/users/", json={
+        "email": "new@example.com", "password": "secret", "first_name": "New", "last_name": "User"
+    })
+
+    assert response.status_code == 201
+    assert response.json()["created_at"] is not None
+    assert len(writes(statements)) == 1
+    assert_no_select_after_first_write(statements)
+
+
+def test_create_user_by_admin_is_one_insert(client, admin_headers, statements):
+    response = client.post("/admin/users/", headers=admin_headers, json={
+        "email": "staff@example.com", "password": "secret", "first_name": "Staff", "last_name": "User", "role": "admin"
+    })
+
+    assert response.status_code == 201
+    assert len(writes(statements)) == 1
+    assert_no_select_after_first_write(statements)
+
+
+def test_create_product_is_one_insert(client, admin_headers, statements):
+    response = client.post("/products/", headers=admin_headers, json={
+        "name": "Runner", "description": "Running shoe", "price": 100.0, "discount_price": 80.0, "category_name": "Shoes"
+    })
+
+    assert response.status_code == 201
+    assert response.json()["effective_price"] == 80.0
+    assert len(writes(statements)) == 1
+    assert_no_select_after_first_write(statements)
+
+
+def test_update_product_is_one_update(client, admin_headers, product, statements):
+    response = client.patch(f"/products/{product['product_id']}", headers=admin_headers, json={"discount_price": None})
+
+    assert response.status_code == 200
+    assert response.json()["effective_price"] == 100.0
+    assert response.json()["updated_at"] is not None
+    assert len(writes(statements)) == 1
+    assert_no_select_after_first_write(statements)
+
+
+def test_create_address_is_one_insert(client, admin_headers, statements):
+    response = client.post("/addresses/", headers=admin_headers, json={
+        "address_line1": "1 Main Street", "city": "Delhi", "state": "Delhi", "postal_code": "110001"
+    })
+
+    assert response.status_code == 201
+    assert len(writes(statements)) == 1
+    assert_no_select_after_first_write(statements)
+
+
+def order_body(product, address, items=2):
+    return {
+        "shipping_address_id": address["address_id"],
+        "billing_address_id": address["address_id"],
+        "items": [{"product_id": product["product_id"], "quantity": i + 1} for i in range(items)],
+    }
+
+
+def detail_inserts(items):
+    # PostgreSQL batches all order lines into one INSERT ... RETURNING, SQLite sends one per line
+    return 1 if engine.dialect.name == "postgresql" else items
+
+
+def test_place_order_budget(client, admin_headers, product, address, statements):
+    # order + order lines + outbox event
+    response = client.post("/orders/", headers=admin_headers, json=order_body(product, address))
+
+    assert response.status_code == 201
+    assert len(response.json()["details"]) == 2
+    assert len(writes(statements)) == 1 + detail_inserts(2) + 1
+    assert_no_select_after_first_write(statements)
+
+
+def test_place_order_with_idempotency_key_budget(client, admin_headers, product, address, statements):
+    # order + order lines + outbox event + idempotency key
+    headers = {**admin_headers, "Idempotency-Key": "order-1"}
+    response = client.post("/orders/", headers=headers, json=order_body(product, address))
+
+    assert response.status_code == 201
+    assert len(writes(statements)) == 1 + detail_inserts(2) + 1 + 1
+    assert_no_select_after_first_write(statements)